@@ -1,3 +1,4 @@
+import functools
 import logging
 from collections.abc import Generator
 from typing import Optional, Union
@@ -29,6 +30,10 @@ from dify_plugin.entities.model.message import (
 
 logger = logging.getLogger(__name__)
 
+# _add_function_call的结果缓存：同一(model, api_key)的schema特性不会变化，
+# 避免每次_invoke都重新走一遍get_model_schema
+_function_call_cache: dict = {}
+
 
 class SophnetLargeLanguageModel(OAICompatLargeLanguageModel):
     """
@@ -106,11 +111,19 @@ class SophnetLargeLanguageModel(OAICompatLargeLanguageModel):
         credentials["endpoint_url"] = cls.endpoint_url
 
     def _add_function_call(self, model: str, credentials: dict) -> None:
-        model_schema = self.get_model_schema(model, credentials)
-        if model_schema and {ModelFeature.TOOL_CALL, ModelFeature.MULTI_TOOL_CALL}.intersection(
-            model_schema.features or []
-        ):
-            credentials["function_calling_type"] = "tool_call"    
+        cache_key = (model, credentials.get("api_key"))
+        supports_tool_call = _function_call_cache.get(cache_key)
+        if supports_tool_call is None:
+            model_schema = self.get_model_schema(model, credentials)
+            supports_tool_call = bool(
+                model_schema
+                and {ModelFeature.TOOL_CALL, ModelFeature.MULTI_TOOL_CALL}.intersection(
+                    model_schema.features or []
+                )
+            )
+            _function_call_cache[cache_key] = supports_tool_call
+        if supports_tool_call:
+            credentials["function_calling_type"] = "tool_call"
 
     def get_customizable_model_schema(
         self, model: str, credentials: dict
@@ -124,6 +137,19 @@ class SophnetLargeLanguageModel(OAICompatLargeLanguageModel):
 
         :return: model schema
         """
+        # entity只依赖这几个字段，按其缓存即可避免每次请求重建整棵ParameterRule树
+        return self._build_customizable_model_schema(
+            model,
+            credentials.get("function_calling_type"),
+            int(credentials.get("context_size", 65536)),
+            int(credentials.get("max_tokens", 65536)),
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _build_customizable_model_schema(
+        model: str, function_calling_type: Optional[str], context_size: int, max_tokens: int
+    ) -> AIModelEntity:
         entity = AIModelEntity(
             model=model,
             label=I18nObject(en_US=model, zh_Hans=model),
@@ -134,14 +160,12 @@ class SophnetLargeLanguageModel(OAICompatLargeLanguageModel):
                     ModelFeature.AGENT_THOUGHT,
                     ModelFeature.STREAM_TOOL_CALL,
                 ]
-                if credentials.get("function_calling_type") == "tool_call"
+                if function_calling_type == "tool_call"
                 else []
             ),
             fetch_from=FetchFrom.CUSTOMIZABLE_MODEL,
             model_properties={
-                ModelPropertyKey.CONTEXT_SIZE: int(
-                    credentials.get("context_size", 65536)
-                ),
+                ModelPropertyKey.CONTEXT_SIZE: context_size,
                 ModelPropertyKey.MODE: LLMMode.CHAT.value,
             },
             parameter_rules=[
@@ -156,7 +180,7 @@ class SophnetLargeLanguageModel(OAICompatLargeLanguageModel):
                     use_template="max_tokens",
                     default=65536,
                     min=1,
-                    max=int(credentials.get("max_tokens", 65536)),
+                    max=max_tokens,
                     label=I18nObject(en_US="Max Tokens", zh_Hans="最大标记"),
                     type=ParameterType.INT,
                 ),
@@ -1,6 +1,13 @@
+import functools
+import json
+import random
 import time
 from typing import IO, Optional
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util.retry import Retry
 import os
 import pathlib
 
@@ -21,6 +28,61 @@ from dify_plugin.entities.model import (
     PriceConfig,
 )
 
+# 模块级Session，复用连接池，轮询循环和批量调用走keep-alive，避免重复TCP+TLS握手
+_session = requests.Session()
+_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+    ),
+)
+
+
+@functools.lru_cache(maxsize=32)
+def _auth_headers(api_key: str) -> dict:
+    """同一api_key的请求头只构建一次；调用方不得原地修改"""
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+@functools.lru_cache(maxsize=32)
+def _json_headers(api_key: str) -> dict:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+
+@functools.lru_cache(maxsize=32)
+def _transcriptions_url(project_id: str) -> str:
+    return f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/speechtotext/transcriptions"
+
+
+@functools.lru_cache(maxsize=64)
+def _data_part(easyllm_id: str) -> str:
+    """multipart中data字段的JSON串，同一easyllm_id只序列化一次"""
+    return json.dumps({"easyllm_id": easyllm_id}, separators=(",", ":"))
+
+
+# schema中与model无关的静态部分在导入时构建一次，每次调用只覆盖依赖model的字段
+_MODEL_PROPERTIES = {
+    ModelPropertyKey.FILE_UPLOAD_LIMIT: 1024,  # 1GB 限制
+    ModelPropertyKey.SUPPORTED_FILE_EXTENSIONS: "wav,mp3,m4a,flv,mp4,wma,3gp,amr,aac,ogg-opus,flac",
+}
+_EASYLLM_ID_RULE = ParameterRule(
+    name="easyllm_id",
+    label=I18nObject(en_US="EasyLLM ID", zh_Hans="EasyLLM ID"),
+    type=ParameterType.STRING,
+    required=True,
+)
+_PRICING = PriceConfig(
+    input=0.0,  # 1.2元/小时
+    output=0.0, # 暂不收费，后续根据实际使用情况调整
+    unit=0.000001,
+    currency="RMB"
+)
+
 
 class SophnetSpeech2TextModel(Speech2TextModel):
     """
@@ -46,21 +108,18 @@ class SophnetSpeech2TextModel(Speech2TextModel):
         
         # 准备表单数据
         # 根据API文档，data字段必须为JSON字符串，并指定content-type为application/json
-        files = {
-            'audio_file': file,
-            'data': (None, f'{{"easyllm_id": "{easyllm_id}"}}', 'application/json')
-        }
-        
-        # 设置multipart/form-data请求头
-        request_headers = headers.copy()
-        # 当使用files参数时，requests会自动设置正确的Content-Type和boundary
-        # 不需要手动设置'Content-Type': 'multipart/form-data'
+        # MultipartEncoder按块流式读取文件，避免1GB级音频整体载入内存
+        encoder = MultipartEncoder(fields={
+            'audio_file': ('audio', file, 'application/octet-stream'),
+            'data': (None, _data_part(easyllm_id), 'application/json')
+        })
+        request_headers = {**headers, 'Content-Type': encoder.content_type}
         
         # 创建转录任务
         try:
-            response = requests.post(url, headers=request_headers, files=files, timeout=600)
+            response = _session.post(url, headers=request_headers, data=encoder, timeout=(5, 600))
             response.raise_for_status()
-            task_data = response.json()
+            task_data = orjson.loads(response.content)
             
             if 'task_id' not in task_data:
                 raise InvokeBadRequestError(f"Failed to create transcription task: {response.text}")
@@ -73,67 +132,78 @@ class SophnetSpeech2TextModel(Speech2TextModel):
         except Exception as e:
             raise InvokeBadRequestError(f"Sophnet speech2text API call failed: {e}")
 
-    def _poll_task_result(self, credentials: dict, task_id: str, max_retries: int = 60, interval: int = 5) -> str:
+    def _poll_task_result(
+        self,
+        credentials: dict,
+        task_id: str,
+        max_retries: int = 60,
+        initial_interval: float = 0.5,
+        max_interval: float = 15.0,
+    ) -> str:
         """
-        轮询获取转录任务结果
-        
+        轮询获取转录任务结果，采用指数退避+抖动：
+        短音频在首次快速探测后即可返回，长音频逐步拉大间隔直到上限
+
         任务状态说明：
         - waiting: 任务等待中
         - doing: 任务执行中
         - success: 任务成功
         - failed: 任务失败
-        
+
         :param credentials: 凭证信息
         :param task_id: 任务ID
         :param max_retries: 最大重试次数
-        :param interval: 轮询间隔(秒)
+        :param initial_interval: 首次轮询间隔(秒)
+        :param max_interval: 轮询间隔上限(秒)
         :return: 转录文本结果
         """
         project_id = credentials.get("project_id")
         api_key = credentials.get("api_key")
         
-        url = f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/speechtotext/transcriptions/{task_id}"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        for retry in range(max_retries):
+        url = f"{_transcriptions_url(project_id)}/{task_id}"
+        headers = _json_headers(api_key)
+        # 请求只准备一次，循环内直接send，免去每次轮询的URL解析和header编码
+        prepared = _session.prepare_request(requests.Request("GET", url, headers=headers))
+
+        delay = initial_interval
+        waited = 0.0
+        for _ in range(max_retries):
             try:
-                response = requests.get(url, headers=headers, timeout=30)
+                response = _session.send(prepared, timeout=(3, 10))
                 response.raise_for_status()
-                data = response.json()
-                
+                data = orjson.loads(response.content)
+
                 status = data.get("status", "")
-                
+
                 if status == "success":
                     return data.get("result", "")
                 elif status == "failed":
                     error_msg = data.get("errorMsg", "Unknown error")
                     raise InvokeBadRequestError(f"Transcription failed: {error_msg}")
-                elif status == "waiting":
-                    # 任务等待中，继续等待
-                    pass
-                elif status == "doing":
-                    # 任务执行中，继续等待
+                elif status in ("waiting", "doing"):
+                    # 任务尚未完成，按退避间隔继续等待
                     pass
                 else:
                     # 未知状态
                     raise InvokeBadRequestError(f"Unknown task status: {status}")
-                
-                # 如果任务仍在进行中，等待后重试
-                time.sleep(interval)
-                
-                # 对于较长音频，适当增加等待时间
-                if retry > 10 and interval < 15:
-                    interval = min(interval + 1, 15)  # 逐渐增加等待时间，但不超过15秒
-                
+
+                # 优先遵循服务端的Retry-After，否则按指数退避+抖动
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    sleep_time = min(float(retry_after), max_interval)
+                else:
+                    sleep_time = delay + random.uniform(0, 0.2 * delay)
+                time.sleep(sleep_time)
+                waited += sleep_time
+                # delay本身封顶，抖动按封顶后的值计算，最坏单次睡眠为max_interval*1.2
+                delay = min(delay * 1.6, max_interval)
+
             except Exception as e:
                 if isinstance(e, InvokeBadRequestError):
                     raise e
                 raise InvokeBadRequestError(f"Failed to get transcription result: {e}")
-        
-        raise InvokeBadRequestError(f"Transcription task {task_id} timed out after {max_retries * interval} seconds")
+
+        raise InvokeBadRequestError(f"Transcription task {task_id} timed out after {max_retries} polls ({waited:.0f} seconds)")
 
     def validate_credentials(self, model: str, credentials: dict) -> None:
         """
@@ -161,22 +231,20 @@ class SophnetSpeech2TextModel(Speech2TextModel):
             with open(audio_file_path, "rb") as audio_file:
                 # 尝试调用API但不等待完整结果
                 url, headers, _ = self._build_request_params(credentials, model)
-                # 确保格式与API文档一致
-                files = {
-                    'audio_file': audio_file,
-                    'data': (None, f'{{"easyllm_id": "{easyllm_id}"}}', 'application/json')
-                }
-                
-                # 使用request_headers而不是headers
-                request_headers = headers.copy()
-                response = requests.post(url, headers=request_headers, files=files, timeout=30)
+                # 确保格式与API文档一致，上传体同样走流式multipart
+                encoder = MultipartEncoder(fields={
+                    'audio_file': ('audio', audio_file, 'application/octet-stream'),
+                    'data': (None, _data_part(easyllm_id), 'application/json')
+                })
+                request_headers = {**headers, 'Content-Type': encoder.content_type}
+                response = _session.post(url, headers=request_headers, data=encoder, timeout=(5, 30))
                 if response.status_code != 200:
                     raise CredentialsValidateFailedError(
                         f"Credentials validation failed with status code {response.status_code}: {response.text}"
                     )
                 
                 # 检查返回的任务ID
-                data = response.json()
+                data = orjson.loads(response.content)
                 if 'task_id' not in data:
                     raise CredentialsValidateFailedError("Invalid API response: no task_id returned")
                 
@@ -196,25 +264,11 @@ class SophnetSpeech2TextModel(Speech2TextModel):
             label=I18nObject(en_US=f"Sophnet Speech to Text ({model})", zh_Hans=f"Sophnet 语音转文本 ({model})"),
             model_type=ModelType.SPEECH2TEXT,
             fetch_from=FetchFrom.CUSTOMIZABLE_MODEL,
-            model_properties={
-                ModelPropertyKey.FILE_UPLOAD_LIMIT: 1024,  # 1GB 限制
-                ModelPropertyKey.SUPPORTED_FILE_EXTENSIONS: "wav,mp3,m4a,flv,mp4,wma,3gp,amr,aac,ogg-opus,flac",
-            },
+            model_properties=dict(_MODEL_PROPERTIES),
             parameter_rules=[
-                ParameterRule(
-                    name="easyllm_id",
-                    label=I18nObject(en_US="EasyLLM ID", zh_Hans="EasyLLM ID"),
-                    type=ParameterType.STRING,
-                    required=True,
-                    default=model
-                ),
+                _EASYLLM_ID_RULE.model_copy(update={"default": model}),
             ],
-            pricing=PriceConfig(
-                input=0.0,  # 1.2元/小时
-                output=0.0, # 暂不收费，后续根据实际使用情况调整
-                unit=0.000001,
-                currency="RMB"
-            ),
+            pricing=_PRICING,
         )
         return entity
 
@@ -236,10 +290,8 @@ class SophnetSpeech2TextModel(Speech2TextModel):
         
         easyllm_id = credentials.get("easyllm_id", model)
         
-        url = f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/speechtotext/transcriptions"
-        headers = {
-            "Authorization": f"Bearer {api_key}"
-        }
+        url = _transcriptions_url(project_id)
+        headers = _auth_headers(api_key)
         
         return url, headers, easyllm_id
 
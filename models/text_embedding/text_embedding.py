@@ -1,6 +1,19 @@
+import functools
+import gzip
+import hashlib
 import json
+import os
+import struct
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
+
+import httpx
+import numpy as np
+import orjson
+import tiktoken
 from dify_plugin.interfaces.model.openai_compatible.text_embedding import OAICompatEmbeddingModel
 from dify_plugin.entities import I18nObject
 from dify_plugin.entities.model import (
@@ -18,7 +31,133 @@ from dify_plugin.entities.model.text_embedding import (
     TextEmbeddingResult,
 )
 from dify_plugin.errors.model import CredentialsValidateFailedError
-import requests
+
+# 模块级HTTP/2客户端：插件接口是同步的，async内部实现并不能释放工作线程，
+# 因此保留线程池并发，由HTTP/2把所有批次多路复用到同一条连接上
+_client = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    # connect短、read长：挂死的连接几秒内暴露，而不是吃满整个读超时
+    timeout=httpx.Timeout(30.0, connect=5.0),
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding() -> "tiktoken.Encoding":
+    return tiktoken.get_encoding("cl100k_base")
+
+
+# 请求体超过该大小才gzip压缩
+_GZIP_THRESHOLD = 4096
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_headers(api_key: str) -> dict:
+    """同一api_key的请求头只构建一次；调用方不得原地修改"""
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_endpoint(project_id: str) -> str:
+    return f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/embeddings"
+
+# 截断结果缓存：重复chunk不再重复分词
+_TRUNC_CACHE: "OrderedDict[tuple, str]" = OrderedDict()
+_TRUNC_CACHE_LOCK = threading.Lock()
+_TRUNC_CACHE_MAX = 8192
+
+
+def _truncate_all(texts: List[str], max_tokens: int) -> List[str]:
+    """
+    按token精确截断（tiktoken编码后截取前缀再解码）。
+    缓存未命中的文本走encode_ordinary_batch，在原生线程中并行分词
+    """
+    results: List[Optional[str]] = [None] * len(texts)
+    miss_indices = []
+    miss_texts = []
+    with _TRUNC_CACHE_LOCK:
+        for idx, text in enumerate(texts):
+            cached = _TRUNC_CACHE.get((text, max_tokens))
+            if cached is not None:
+                _TRUNC_CACHE.move_to_end((text, max_tokens))
+                results[idx] = cached
+            else:
+                miss_indices.append(idx)
+                miss_texts.append(text)
+
+    if miss_texts:
+        encoding = _get_encoding()
+        token_lists = encoding.encode_ordinary_batch(miss_texts, num_threads=os.cpu_count() or 4)
+        with _TRUNC_CACHE_LOCK:
+            for idx, text, ids in zip(miss_indices, miss_texts, token_lists):
+                truncated = text if len(ids) <= max_tokens else encoding.decode(ids[:max_tokens])
+                results[idx] = truncated
+                _TRUNC_CACHE[(text, max_tokens)] = truncated
+            while len(_TRUNC_CACHE) > _TRUNC_CACHE_MAX:
+                _TRUNC_CACHE.popitem(last=False)
+
+    return results
+
+
+# 客户端embedding缓存：RAG重复ingest时同一chunk反复出现，命中即省一次完整RTT和token计费
+_EMB_CACHE: "OrderedDict[bytes, List[float]]" = OrderedDict()
+_EMB_CACHE_LOCK = threading.Lock()
+_EMB_CACHE_MAX = 50000
+
+
+def _embedding_cache_key(text: str, easyllm_id: str, dimensions: int) -> bytes:
+    return (
+        hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        + struct.pack("<H", dimensions)
+        + easyllm_id.encode("utf-8")
+    )
+
+
+def _embedding_cache_get(key: bytes) -> Optional[List[float]]:
+    with _EMB_CACHE_LOCK:
+        embedding = _EMB_CACHE.get(key)
+        if embedding is not None:
+            _EMB_CACHE.move_to_end(key)
+        return embedding
+
+
+def _embedding_cache_put(key: bytes, embedding: List[float]) -> None:
+    with _EMB_CACHE_LOCK:
+        _EMB_CACHE[key] = embedding
+        _EMB_CACHE.move_to_end(key)
+        while len(_EMB_CACHE) > _EMB_CACHE_MAX:
+            _EMB_CACHE.popitem(last=False)
+
+
+# schema中与model无关的静态部分在导入时构建一次，每次调用只覆盖依赖model的字段
+_MODEL_PROPERTIES = {
+    ModelPropertyKey.CONTEXT_SIZE: 8192,
+    ModelPropertyKey.MAX_CHUNKS: 10,
+}
+_EASYLLM_ID_RULE = ParameterRule(
+    name="easyllm_id",
+    label=I18nObject(en_US="EasyLLM ID", zh_Hans="EasyLLM ID"),
+    type=ParameterType.STRING,
+    required=True,
+)
+_DIMENSIONS_RULE = ParameterRule(
+    name="dimensions",
+    label=I18nObject(en_US="Embedding Dimensions, support 1,024/768/512/256/128/64", zh_Hans="输出Embeddings的维度，支持1,024/768/512/256/128/64"),
+    type=ParameterType.INT,
+    required=True,
+    default="1024",
+    options=["1024", "768", "512", "256", "128", "64"]
+)
+_PRICING = PriceConfig(
+    input=0.5, # https://www.sophnet.com/docs/component/fee.html
+    output=0,
+    unit=0.000001,
+    currency="RMB"
+)
+
 
 class SophnetTextEmbeddingModel(OAICompatEmbeddingModel):
     """
@@ -41,51 +180,93 @@ class SophnetTextEmbeddingModel(OAICompatEmbeddingModel):
         max_chunks = self._get_max_chunks(model, credentials)
         url, headers, easyllm_id, dimensions = self._build_request_params(credentials, model)
 
-        # 1. 按context_size截断每条文本
-        processed_texts = []
-        for text in texts:
-            num_tokens = self._get_num_tokens_by_gpt2(text)
-            if num_tokens > context_size:
-                # 近似按字符截断
-                cutoff = int(len(text) * context_size / num_tokens)
-                processed_texts.append(text[:cutoff])
+        # 1. 按context_size截断每条文本（token级精确截断，CJK文本按字符比例估算会严重偏差）
+        processed_texts = _truncate_all(texts, context_size)
+
+        # 2. 先查客户端缓存，命中的文本不再请求，只有未命中的进入分批
+        # 结果矩阵按(len(texts), dimensions)一次性预分配，避免list反复扩容
+        out = np.empty((len(processed_texts), dimensions), dtype=np.float32)
+        cache_keys = []
+        miss_indices = []
+        miss_texts = []
+        for idx, text in enumerate(processed_texts):
+            key = _embedding_cache_key(text, easyllm_id, dimensions)
+            cache_keys.append(key)
+            cached = _embedding_cache_get(key)
+            if cached is not None:
+                out[idx] = cached
             else:
-                processed_texts.append(text)
+                miss_indices.append(idx)
+                miss_texts.append(text)
 
-        # 2. 按max_chunks分批请求
-        all_embeddings = []
+        # 3. 按max_chunks分批，批次之间并发请求（I/O密集，线程池+连接池复用）
+        # 批次间不变的字段只构建一次，循环内仅补充input_texts
+        base_payload = {"easyllm_id": easyllm_id, "dimensions": dimensions}
+        batches = [miss_texts[i:i+max_chunks] for i in range(0, len(miss_texts), max_chunks)]
         total_tokens = 0
 
-        for i in range(0, len(processed_texts), max_chunks):
-            batch_texts = processed_texts[i:i+max_chunks]
-            payload = {
-                "easyllm_id": easyllm_id,
-                "input_texts": batch_texts,
-                "dimensions": dimensions
-            }
+        if len(batches) <= 1:
+            batch_results = [self._post_batch(url, headers, base_payload, batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(8, len(batches))) as pool:
+                futures = [
+                    pool.submit(self._post_batch, url, headers, base_payload, batch)
+                    for batch in batches
+                ]
+                # 按提交顺序收集，保证embedding与输入文本顺序一致
+                batch_results = [future.result() for future in futures]
+
+        # 4. 未命中的结果按原顺序整批写回矩阵并写入缓存；
+        # 矩阵是np.empty预分配，每个批次在写矩阵和写缓存之前先校验行数：
+        # 整体计数事后才查会放过"一批少一批多"的错位，且错位对已进缓存
+        pos = 0
+        for (batch_embeddings, batch_tokens), batch in zip(batch_results, batches):
+            if len(batch_embeddings) != len(batch):
+                raise RuntimeError(
+                    f"Sophnet embedding API returned {len(batch_embeddings)} embeddings "
+                    f"for a batch of {len(batch)} inputs"
+                )
+            rows = miss_indices[pos:pos + len(batch_embeddings)]
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-            except Exception as e:
-                raise RuntimeError(f"Sophnet embedding API call failed: {e}")
-
-            # 解析返回结果
-            batch_embeddings = [item["embedding"] for item in data.get("data", [])]
-            all_embeddings.extend(batch_embeddings)
-            usage = data.get("usage", {})
-            total_tokens += usage.get("total_tokens", 0) or 0
+                out[rows] = np.asarray(batch_embeddings, dtype=np.float32)
+            except ValueError as e:
+                raise RuntimeError(f"Sophnet embedding API returned malformed embeddings: {e}")
+            for row_idx, embedding in zip(rows, batch_embeddings):
+                _embedding_cache_put(cache_keys[row_idx], embedding)
+            pos += len(batch_embeddings)
+            total_tokens += batch_tokens
 
         # 用法统计
         usage_obj = self._calc_response_usage(model=model, credentials=credentials, tokens=total_tokens)
 
         return TextEmbeddingResult(
-            embeddings=all_embeddings,
+            embeddings=out.tolist(),
             usage=usage_obj,
             model=model
         )
     
 
+    def _post_batch(self, url: str, headers: dict, base_payload: dict, batch_texts: List[str]) -> tuple:
+        """
+        请求单个embedding批次，返回(embeddings, total_tokens)
+        """
+        payload = {**base_payload, "input_texts": batch_texts}
+        # 大批次请求体gzip压缩后上行，减少慢启动阶段的往返；小请求体压缩得不偿失
+        body = orjson.dumps(payload)
+        if len(body) > _GZIP_THRESHOLD:
+            body = gzip.compress(body, compresslevel=1)
+            headers = {**headers, "Content-Encoding": "gzip"}
+        try:
+            response = _client.post(url, headers=headers, content=body)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+        except Exception as e:
+            raise RuntimeError(f"Sophnet embedding API call failed: {e}")
+
+        batch_embeddings = [item["embedding"] for item in data.get("data", [])]
+        usage = data.get("usage", {})
+        return batch_embeddings, usage.get("total_tokens", 0) or 0
+
     def validate_credentials(self, model: str, credentials: dict) -> None:
         """
         校验Sophnet API凭证有效性，需project_id、api_key、easyllm_id、dimensions
@@ -97,12 +278,12 @@ class SophnetTextEmbeddingModel(OAICompatEmbeddingModel):
             "dimensions": dimensions
         }
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
+            response = _client.post(url, headers=headers, json=payload, timeout=httpx.Timeout(10.0, connect=5.0))
             if response.status_code != 200:
                 raise CredentialsValidateFailedError(
                     f"Credentials validation failed with status code {response.status_code}"
                 )
-            data = response.json()
+            data = orjson.loads(response.content)
             if not data.get("data"):
                 raise CredentialsValidateFailedError("Credentials validation failed: no embedding data returned")
         except Exception as ex:
@@ -117,33 +298,12 @@ class SophnetTextEmbeddingModel(OAICompatEmbeddingModel):
             label=I18nObject(en_US=f"Sophnet Embedding ({model})"),
             model_type=ModelType.TEXT_EMBEDDING,
             fetch_from=FetchFrom.CUSTOMIZABLE_MODEL,
-            model_properties={
-                ModelPropertyKey.CONTEXT_SIZE: 8192,
-                ModelPropertyKey.MAX_CHUNKS: 10,
-            },
+            model_properties=dict(_MODEL_PROPERTIES),
             parameter_rules=[
-                ParameterRule(
-                    name="easyllm_id",
-                    label=I18nObject(en_US="EasyLLM ID", zh_Hans="EasyLLM ID"),
-                    type=ParameterType.STRING,
-                    required=True,
-                    default=model
-                ),
-                ParameterRule(
-                    name="dimensions",
-                    label=I18nObject(en_US="Embedding Dimensions, support 1,024/768/512/256/128/64", zh_Hans="输出Embeddings的维度，支持1,024/768/512/256/128/64"),
-                    type=ParameterType.INT,
-                    required=True,
-                    default="1024",
-                    options=["1024", "768", "512", "256", "128", "64"]
-                ),
+                _EASYLLM_ID_RULE.model_copy(update={"default": model}),
+                _DIMENSIONS_RULE,
             ],
-            pricing=PriceConfig(
-                input=0.5, # https://www.sophnet.com/docs/component/fee.html
-                output=0,
-                unit=0.000001,
-                currency="RMB"
-            ),
+            pricing=_PRICING,
         )
         return entity
 
@@ -157,10 +317,7 @@ class SophnetTextEmbeddingModel(OAICompatEmbeddingModel):
         easyllm_id = credentials.get("easyllm_id", model)
         dimensions = int(credentials.get("dimensions", 1024))
         url = credentials.get("endpoint_url", "")
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        headers = _cached_headers(api_key)
         return url, headers, easyllm_id, dimensions
     
     @classmethod
@@ -171,4 +328,4 @@ class SophnetTextEmbeddingModel(OAICompatEmbeddingModel):
         api_key = credentials.get("api_key")
         if not api_key:
             raise ValueError("api_key is required")
-        credentials["endpoint_url"] = f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/embeddings"
+        credentials["endpoint_url"] = _cached_endpoint(project_id)
@@ -1,7 +1,17 @@
-import base64
-import json
-from typing import Dict, Generator, List, Mapping, Optional
-import requests
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import ClassVar, Dict, Generator, List, Mapping, Optional, Sequence
+import httpx
+import orjson
+
+try:
+    # SIMD加速的base64解码（AVX2/SSSE3），流式音频帧解码的主要CPU开销所在
+    from pybase64 import b64decode as _b64decode
+except ImportError:
+    # 退化路径直接用binascii的C实现：base64.b64decode只是它的校验包装，
+    # 每次调用多一层Python帧和临时分配
+    from binascii import a2b_base64 as _b64decode
 
 from dify_plugin.entities import I18nObject
 from dify_plugin.entities.model import (
@@ -21,6 +31,24 @@ from dify_plugin.errors.model import (
 from dify_plugin.interfaces.model.tts_model import TTSModel
 
 
+# SSE数据行前缀
+_DATA_PREFIX = b"data:"
+
+
+@functools.lru_cache(maxsize=64)
+def _endpoints(project_id: str, api_key: str) -> tuple:
+    """
+    同一(project_id, api_key)的接口URL与请求头只构建一次；
+    headers为共享对象，调用方不得原地修改
+    """
+    base = f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/voice"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    return f"{base}/synthesize-audio-stream", f"{base}/synthesize-audio", headers
+
+
 class SophnetText2SpeechModel(TTSModel):
     """
     Model class for Sophnet Text to Speech model.
@@ -55,6 +83,13 @@ class SophnetText2SpeechModel(TTSModel):
         {"name": "Stella", "mode": "loongstella", "language": "en-US"},
         {"name": "Bella", "mode": "loongbella", "language": "en-US"},
     ]
+    # 类定义时预计算：音色合法性检查O(1)，语言过滤变为字典查找
+    _SUPPORTED_VOICE_MODES = frozenset(v["mode"] for v in SUPPORTED_VOICES)
+    _ALL_VOICE_OPTIONS = [{"name": v["name"], "value": v["mode"]} for v in SUPPORTED_VOICES]
+    _VOICE_OPTIONS_BY_LANG: ClassVar[Dict[str, List[Dict]]] = {}
+    for _v in SUPPORTED_VOICES:
+        _VOICE_OPTIONS_BY_LANG.setdefault(_v["language"], []).append({"name": _v["name"], "value": _v["mode"]})
+    del _v
     # 支持的格式列表
     SUPPORTED_FORMATS = [
         "MP3_16000HZ_MONO_128KBPS",
@@ -65,6 +100,70 @@ class SophnetText2SpeechModel(TTSModel):
         "WAV_48000HZ_MONO_16BIT",
     ]
 
+    # 类级HTTP/2客户端懒加载：逐句并发的多个请求多路复用到同一条TLS连接，
+    # 免去HTTP/1.1下N句并发要建N条连接的握手开销
+    _client: ClassVar[Optional[httpx.Client]] = None
+    _client_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    # synthesis_param静态默认模板，运行时仅做一次dict合并
+    _DEFAULT_SYNTH_PARAM: ClassVar[Dict] = {
+        "format": DEFAULT_FORMAT,
+        "volume": 50,
+        "speechRate": 1.0,
+        "pitchRate": 1.0,
+    }
+    # 可由凭证覆盖的合成参数键及其类型转换：凭证表单是text-input，
+    # Dify落库和透传的都是字符串，必须在这里转成数值再上送
+    _SYNTH_OVERRIDE_CASTS: ClassVar[Dict] = {
+        "format": str,
+        "volume": int,
+        "speechRate": float,
+        "pitchRate": float,
+    }
+
+    # 累积到该字节数（base64字符数）才合并解码并下发；
+    # 21848个base64字符解码后约16KiB，保证每次yield给下游的都是大块写
+    _FLUSH_THRESHOLD = 21848
+    # 解码流水线线程池：base64解码在后台线程进行，读循环继续收包，
+    # 网络接收与CPU解码重叠；解码短促，2个worker足够覆盖并发流
+    _decode_pool: ClassVar[ThreadPoolExecutor] = ThreadPoolExecutor(
+        max_workers=2, thread_name_prefix="tts-decode"
+    )
+    # 逐句并发合成的最大并发数（与schema中MAX_WORKERS一致）
+    MAX_WORKERS = 3
+
+    @staticmethod
+    def _decode_frames(frames: List[str]) -> bytes:
+        """
+        合并解码一批base64帧。中间帧是完整4字符组且不带padding时可以拼接后
+        一次解码（向量化解码器在长输入上收益最大）；否则逐帧解码后拼接
+        """
+        if len(frames) == 1:
+            return _b64decode(frames[0])
+        joinable = all(len(frame) % 4 == 0 and '=' not in frame for frame in frames[:-1])
+        if joinable:
+            return _b64decode("".join(frames))
+        return b"".join(_b64decode(frame) for frame in frames)
+
+    @classmethod
+    def _get_client(cls) -> httpx.Client:
+        if cls._client is None:
+            with cls._client_lock:
+                if cls._client is None:
+                    # 显式传transport时Client级的http2/limits会被忽略，
+                    # 连接池配置必须写在HTTPTransport上才生效
+                    cls._client = httpx.Client(
+                        headers={"Content-Type": "application/json"},
+                        # connect短、read长：挂死的连接几秒内暴露
+                        timeout=httpx.Timeout(60.0, connect=5.0),
+                        transport=httpx.HTTPTransport(
+                            http2=True,
+                            retries=2,
+                            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+                        ),
+                    )
+        return cls._client
+
     def _invoke(
         self,
         model: str,
@@ -86,26 +185,31 @@ class SophnetText2SpeechModel(TTSModel):
         :return: 音频数据流
         """
         # 验证并获取有效的音色
-        if not voice or voice not in [v["mode"] for v in self.SUPPORTED_VOICES]:
+        if not voice or voice not in self._SUPPORTED_VOICE_MODES:
             voice = self.DEFAULT_VOICE
 
         # 获取流式/非流式设置
         streaming = credentials.get("streaming", True)
         
-        # 根据文本长度拆分文本
-        if len(content_text) > 500:
-            sentences = self._split_text_into_sentences(content_text, max_length=500)
-        else:
-            sentences = [content_text]
+        # 根据文本长度拆分文本；短文本（绝大多数调用）直接用一元素元组，不走拆分
+        sentences = (
+            self._split_text_into_sentences(content_text, max_length=500)
+            if len(content_text) > 500
+            else (content_text,)
+        )
         
+        # easyllm_id每次请求只解析一次，向下透传，热路径不再重复.get+分支
+        easyllm_id = credentials.get("easyllm_id") or model or self.DEFAULT_MODEL
+
         # 调用相应的接口
         if streaming:
-            yield from self._invoke_streaming(model, credentials, sentences, voice)
+            yield from self._invoke_streaming(model, credentials, sentences, voice, easyllm_id)
         else:
-            yield from self._invoke_non_streaming(model, credentials, sentences, voice)
+            yield from self._invoke_non_streaming(model, credentials, sentences, voice, easyllm_id)
 
     def _invoke_streaming(
-        self, model: str, credentials: dict, sentences: List[str], voice: str
+        self, model: str, credentials: dict, sentences: Sequence[str], voice: str,
+        easyllm_id: Optional[str] = None,
     ) -> Generator[bytes, None, None]:
         """
         调用流式文本转语音接口
@@ -114,37 +218,113 @@ class SophnetText2SpeechModel(TTSModel):
         :param credentials: 模型凭证
         :param sentences: 文本句子列表
         :param voice: 音色
+        :param easyllm_id: 已解析的easyllm_id，未传时在参数构建中解析
         :return: 音频数据流
         """
         url, headers, payload = self._build_request_params(
-            credentials, model, sentences, voice, True
+            credentials, model, sentences, voice, True, easyllm_id=easyllm_id
         )
-        
+
+        if len(sentences) <= 1:
+            yield from self._stream_one(url, headers, payload)
+            return
+
+        # 逐句并发合成：第一句实时下发，后续句子在线程池里并行合成并缓冲，
+        # 按原文顺序输出，首音频延迟只取决于第一句
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as pool:
+            futures = [
+                pool.submit(self._stream_to_bytes, url, headers, {**payload, "text": [sentence]})
+                for sentence in sentences[1:]
+            ]
+            yield from self._stream_one(url, headers, {**payload, "text": [sentences[0]]})
+            for future in futures:
+                yield future.result()
+
+    def _stream_one(self, url: str, headers: dict, payload: dict) -> Generator[bytes, None, None]:
+        """
+        发起单个流式合成请求并产出音频数据
+        """
+        # httpx传输层错误（含流读取阶段）统一映射为InvokeBadRequestError
+        frames: List[str] = []
+        frames_len = 0
+        pending = None
         try:
-            response = requests.post(url, headers=headers, json=payload, stream=True, timeout=60)
-            response.raise_for_status()
-            
-            # 处理流式响应
-            for line in response.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                    
-                # 流式响应格式为: data: {...}
-                if line.startswith('data:'):
-                    try:
-                        data = json.loads(line[5:])
-                        if 'audioFrame' in data and data['audioFrame']:
-                            # 解码base64音频数据
-                            audio_bytes = base64.b64decode(data['audioFrame'])
-                            yield audio_bytes
-                    except json.JSONDecodeError:
+            with self._get_client().stream(
+                "POST", url, headers=headers, content=orjson.dumps(payload)
+            ) as response:
+                # 服务端严格遵循Accept、拒绝二进制流时（406），
+                # 去掉Accept头重试一次，回到SSE解析路径
+                if response.status_code == 406 and "Accept" in headers:
+                    response.close()
+                    yield from self._stream_one(
+                        url, {k: v for k, v in headers.items() if k != "Accept"}, payload
+                    )
+                    return
+                response.raise_for_status()
+
+                # 服务端支持原始音频分块流时直接透传，绕过SSE帧和base64
+                if response.headers.get("Content-Type", "").startswith("audio/"):
+                    yield from response.iter_bytes(chunk_size=65536)
+                    return
+
+                # 处理流式响应：按字节切分SSE行，base64载荷不经过Unicode解码；
+                # memoryview切片喂给orjson，每帧零拷贝；消费过的缓冲按块回收而不是逐行搬移。
+                # 连续帧先累积，攒够一定量再合并解码，摊薄每帧的解码和yield开销
+                buf = bytearray()
+                pos = 0
+                # 流水线：上一批在后台解码时，本循环继续从socket收下一批
+                for chunk in response.iter_bytes(chunk_size=65536):
+                    if not chunk:
                         continue
-                        
-        except Exception as e:
+                    buf += chunk
+                    view = memoryview(buf)
+                    try:
+                        while (newline := buf.find(b"\n", pos)) >= 0:
+                            start = pos
+                            end = newline
+                            pos = newline + 1
+                            if end > start and buf[end - 1] == 0x0D:  # 去掉\r
+                                end -= 1
+                            # 流式响应格式为: data: {...}
+                            if view[start:start + 5] != _DATA_PREFIX:
+                                continue
+                            try:
+                                data = orjson.loads(view[start + 5:end])
+                            except orjson.JSONDecodeError:
+                                continue
+                            if 'audioFrame' in data and data['audioFrame']:
+                                frames.append(data['audioFrame'])
+                                frames_len += len(data['audioFrame'])
+                                if frames_len >= self._FLUSH_THRESHOLD:
+                                    if pending is not None:
+                                        yield pending.result()
+                                    pending = self._decode_pool.submit(self._decode_frames, frames)
+                                    frames = []
+                                    frames_len = 0
+                    finally:
+                        view.release()
+                    # 已消费部分攒够4KiB才整体删除，避免每行O(n)搬移
+                    if pos >= 4096:
+                        del buf[:pos]
+                        pos = 0
+                if pending is not None:
+                    yield pending.result()
+                if frames:
+                    yield self._decode_frames(frames)
+        except httpx.HTTPError as e:
+            # 连接中断时先把已缓冲的帧下发，已到达的音频仍可播放
+            if pending is not None:
+                yield pending.result()
+            if frames:
+                yield self._decode_frames(frames)
             raise InvokeBadRequestError(f"Sophnet TTS streaming API call failed: {e}")
 
+    def _stream_to_bytes(self, url: str, headers: dict, payload: dict) -> bytes:
+        return b"".join(self._stream_one(url, headers, payload))
+
     def _invoke_non_streaming(
-        self, model: str, credentials: dict, sentences: List[str], voice: str
+        self, model: str, credentials: dict, sentences: Sequence[str], voice: str,
+        easyllm_id: Optional[str] = None,
     ) -> Generator[bytes, None, None]:
         """
         调用非流式文本转语音接口
@@ -153,21 +333,37 @@ class SophnetText2SpeechModel(TTSModel):
         :param credentials: 模型凭证
         :param sentences: 文本句子列表
         :param voice: 音色
+        :param easyllm_id: 已解析的easyllm_id，未传时在参数构建中解析
         :return: 音频数据
         """
         url, headers, payload = self._build_request_params(
-            credentials, model, sentences, voice, False
+            credentials, model, sentences, voice, False, easyllm_id=easyllm_id
         )
-        
+
+        if len(sentences) <= 1:
+            yield self._post_one(url, headers, payload)
+            return
+
+        # 逐句并发合成，按原文顺序下发，整体耗时由最慢句而非句子总和决定
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as pool:
+            futures = [
+                pool.submit(self._post_one, url, headers, {**payload, "text": [sentence]})
+                for sentence in sentences
+            ]
+            for future in futures:
+                yield future.result()
+
+    def _post_one(self, url: str, headers: dict, payload: dict) -> bytes:
+        """
+        发起单个非流式合成请求，返回完整音频数据
+        """
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            response = self._get_client().post(url, headers=headers, content=orjson.dumps(payload))
             response.raise_for_status()
-            
-            # 非流式接口直接返回二进制音频数据
-            yield response.content
-            
-        except Exception as e:
+        except httpx.HTTPError as e:
             raise InvokeBadRequestError(f"Sophnet TTS non-streaming API call failed: {e}")
+        # 非流式接口直接返回二进制音频数据
+        return response.content
 
     def validate_credentials(self, model: str, credentials: Mapping) -> None:
         """
@@ -189,16 +385,28 @@ class SophnetText2SpeechModel(TTSModel):
             if not easyllm_id:
                 raise CredentialsValidateFailedError("easyllm_id is required")
             
-            # 使用简短的文本进行验证
+            # 优先走轻量鉴权探测：GET easyllm详情只验证凭证，单个RTT即可返回，
+            # 不触发服务端真实合成（完整合成验证要1-3秒）
+            probe_url = (
+                f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/{easyllm_id}"
+            )
+            probe = self._get_client().get(
+                probe_url, headers={"Authorization": f"Bearer {api_key}"}, timeout=5
+            )
+            if probe.status_code in (401, 403):
+                raise CredentialsValidateFailedError(
+                    f"Credentials validation failed with status code {probe.status_code}: {probe.text}"
+                )
+            if 200 <= probe.status_code < 500 and probe.status_code != 404:
+                # 2xx或非鉴权类4xx都说明凭证本身有效
+                return
+
+            # 探测接口不可用（404）或服务端异常（5xx）时退回完整合成验证
             test_text = ["你好，这是一个测试"]
-            
-            # 构建请求参数
             url, headers, payload = self._build_request_params(
                 credentials, model, test_text, self.DEFAULT_VOICE, False
             )
-            
-            # 发送请求验证
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
+            response = self._get_client().post(url, headers=headers, content=orjson.dumps(payload), timeout=10)
             if response.status_code != 200:
                 raise CredentialsValidateFailedError(
                     f"Credentials validation failed with status code {response.status_code}: {response.text}"
@@ -218,29 +426,38 @@ class SophnetText2SpeechModel(TTSModel):
         :param language: 语言
         :return: 音色列表
         """
-        voices = self.SUPPORTED_VOICES
-        
-        if language:
-            return [
-                {"name": d["name"], "value": d["mode"]}
-                for d in voices
-                if language and language in d.get("language", "")
-            ]
-        else:
-            return [{"name": d["name"], "value": d["mode"]} for d in voices]
+        # 直接返回类级预计算列表（调用方只读消费），重复调用零分配
+        if not language:
+            return self._ALL_VOICE_OPTIONS
+        # 常见情况是精确的语言代码，直接走预分组字典；否则退回子串匹配
+        exact = self._VOICE_OPTIONS_BY_LANG.get(language)
+        if exact is not None:
+            return exact
+        return [
+            {"name": d["name"], "value": d["mode"]}
+            for d in self.SUPPORTED_VOICES
+            if language in d["language"]
+        ]
 
     def get_customizable_model_schema(self, model: str, credentials: dict) -> AIModelEntity:
         """
         提供可定制的模型配置，支持project_id、api_key、easyllm_id等参数配置
         """
+        # schema只依赖model，缓存后整棵entity树只构建一次；dify侧只读消费
+        return self._build_schema(model)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def _build_schema(model: str) -> AIModelEntity:
+        cls = SophnetText2SpeechModel
         entity = AIModelEntity(
             model=model,
             label=I18nObject(en_US=f"Sophnet Text to Speech ({model})", zh_Hans=f"Sophnet 文本转语音 ({model})"),
             model_type=ModelType.TTS,
             fetch_from=FetchFrom.CUSTOMIZABLE_MODEL,
             model_properties={
-                ModelPropertyKey.DEFAULT_VOICE: self.DEFAULT_VOICE,
-                ModelPropertyKey.VOICES: self.SUPPORTED_VOICES,
+                ModelPropertyKey.DEFAULT_VOICE: cls.DEFAULT_VOICE,
+                ModelPropertyKey.VOICES: cls.SUPPORTED_VOICES,
                 ModelPropertyKey.AUDIO_TYPE: "mp3",
                 ModelPropertyKey.WORD_LIMIT: 500,
                 ModelPropertyKey.MAX_WORKERS: 3,
@@ -265,8 +482,8 @@ class SophnetText2SpeechModel(TTSModel):
                     label=I18nObject(en_US="Audio Format", zh_Hans="音频格式"),
                     type=ParameterType.STRING,
                     required=False,
-                    default=self.DEFAULT_FORMAT,
-                    options=self.SUPPORTED_FORMATS
+                    default=cls.DEFAULT_FORMAT,
+                    options=cls.SUPPORTED_FORMATS
                 ),
                 ParameterRule(
                     name="volume",
@@ -300,7 +517,8 @@ class SophnetText2SpeechModel(TTSModel):
         return entity
 
     def _build_request_params(
-        self, credentials: dict, model: str, texts: List[str], voice: str, streaming: bool
+        self, credentials: dict, model: str, texts: Sequence[str], voice: str, streaming: bool,
+        *, easyllm_id: Optional[str] = None,
     ) -> tuple:
         """
         构建请求参数
@@ -310,6 +528,7 @@ class SophnetText2SpeechModel(TTSModel):
         :param texts: 文本列表
         :param voice: 音色
         :param streaming: 是否使用流式接口
+        :param easyllm_id: 调用方已解析好的easyllm_id，传入时跳过解析
         :return: url, headers, payload
         """
         project_id = credentials.get("project_id")
@@ -320,44 +539,31 @@ class SophnetText2SpeechModel(TTSModel):
         if not api_key:
             raise ValueError("api_key is required")
         
-        easyllm_id = credentials.get("easyllm_id", model)
-        if not easyllm_id:
-            raise ValueError("easyllm_id is required")
+        if easyllm_id is None:
+            easyllm_id = credentials.get("easyllm_id") or model or self.DEFAULT_MODEL
         
-        # 构建URL
-        if streaming:
-            url = f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/voice/synthesize-audio-stream"
-        else:
-            url = f"https://www.sophnet.com/api/open-apis/projects/{project_id}/easyllms/voice/synthesize-audio"
+        # URL与请求头按凭证缓存，每次调用只组装payload
+        stream_url, non_stream_url, headers = _endpoints(project_id, api_key)
+        url = stream_url if streaming else non_stream_url
         
-        # 构建请求头
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        # 配置binary_stream时请求原始二进制分块流，省掉base64带宽和解码开销
+        if streaming and credentials.get("binary_stream", False):
+            headers = {**headers, "Accept": "application/octet-stream"}
         
-        # 构建请求体
-        synthesis_param = {
+        # 构建请求体：静态模板+每次调用的覆盖项一次合并
+        synthesis_param = self._DEFAULT_SYNTH_PARAM | {
             "model": credentials.get("model", model or self.DEFAULT_MODEL),
             "voice": voice,
+            **{
+                k: cast(credentials[k])
+                for k, cast in self._SYNTH_OVERRIDE_CASTS.items()
+                if k in credentials
+            },
         }
         
-        # 添加可选参数
-        if "format" in credentials:
-            synthesis_param["format"] = credentials["format"]
-        
-        if "volume" in credentials:
-            synthesis_param["volume"] = int(credentials["volume"])
-        
-        if "speechRate" in credentials:
-            synthesis_param["speechRate"] = float(credentials["speechRate"])
-        
-        if "pitchRate" in credentials:
-            synthesis_param["pitchRate"] = float(credentials["pitchRate"])
-        
         payload = {
             "easyllm_id": easyllm_id,
-            "text": texts,
+            "text": texts if isinstance(texts, list) else list(texts),
             "synthesis_param": synthesis_param
         }
         